@@ -9,30 +9,100 @@ analyzing potential racial bias in the risk assessment algorithm.
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: figures are only saved to disk
 import matplotlib.pyplot as plt
 import seaborn as sns
-from aif360.algorithms.preprocessing.optim_preproc_helpers.data_preprocessing_functions import load_preproc_data_compas
-from aif360.metrics import ClassificationMetric
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import warnings
 warnings.filterwarnings('ignore')
 
+# Columns used by the audit and the narrowest dtypes that hold them. Integer
+# columns are read as nullable types so rows with missing values survive
+# parsing and are removed by dropna(); INT_DTYPES is applied afterwards.
+RELEVANT_COLUMNS = ['race', 'age', 'sex', 'priors_count', 'c_charge_degree',
+                    'two_year_recid', 'decile_score', 'score_text']
+COLUMN_DTYPES = {
+    'race': 'category',
+    'sex': 'category',
+    'c_charge_degree': 'category',
+    'score_text': 'category',
+    'two_year_recid': 'Int8',
+    'decile_score': 'Int8',
+    'priors_count': 'Int16',
+    'age': 'Int16',
+}
+INT_DTYPES = {
+    'two_year_recid': np.int8,
+    'decile_score': np.int8,
+    'priors_count': np.int16,
+    'age': np.int16,
+}
+
+def _count_contingency_cells(race, y_true, y_pred, out):
+    """Plain counting loop, compiled by Numba in _get_contingency_kernel."""
+    for i in range(race.shape[0]):
+        out[race[i] * 4 + y_true[i] * 2 + y_pred[i]] += 1
+
+# Compiled kernel, built on first use; False once Numba is known to be missing
+_contingency_kernel = None
+
+def _get_contingency_kernel():
+    """Import Numba and compile the counting loop lazily, or return None without Numba."""
+    global _contingency_kernel
+    if _contingency_kernel is None:
+        try:
+            # Imported lazily: Numba's import chain is heavy and only needed here
+            import numba
+            _contingency_kernel = numba.njit(cache=True)(_count_contingency_cells)
+        except ImportError:
+            _contingency_kernel = False
+    return _contingency_kernel or None
+
+
+def _contingency_counts(race, y_true, y_pred, use_numba=False):
+    """
+    Count the 2x2x2 (race, outcome, prediction) contingency table in one pass.
+    
+    Cell index bits are race (4) | actual outcome (2) | prediction (1). Uses a
+    NumPy bincount; use_numba opts into the Numba kernel (worthwhile only for
+    large or repeated audits, since importing Numba costs far more than a
+    bincount over the COMPAS data). Falls back to bincount without Numba.
+    """
+    race = np.asarray(race, dtype=np.uint8)
+    y_true = np.asarray(y_true, dtype=np.uint8)
+    y_pred = np.asarray(y_pred, dtype=np.uint8)
+    
+    kernel = _get_contingency_kernel() if use_numba else None
+    if kernel is None:
+        return np.bincount((race << 2) | (y_true << 1) | y_pred, minlength=8)
+    
+    counts = np.zeros(8, dtype=np.int64)
+    kernel(race, y_true, y_pred, counts)
+    return counts
+
 class CompasBiasAuditor:
     """
     A comprehensive bias auditor for COMPAS recidivism data.
     """
     
-    def __init__(self):
+    def __init__(self, use_numba=False):
         self.data = None
+        self.use_numba = use_numba
         self.dataset_original = None
         self.protected_attributes = ['race']
         self.outcome_column = 'two_year_recid'
+        self._metrics_cache = None
+        self._group_stats = None
+        self._aa_mask = None
+        self._high_risk = None
         
     def load_data(self, file_path='compas-scores-two-years.csv'):
         """Load and preprocess the COMPAS dataset."""
         try:
             print("Loading COMPAS dataset...")
-            self.data = pd.read_csv(file_path)
+            self.data = pd.read_csv(file_path, usecols=RELEVANT_COLUMNS, dtype=COLUMN_DTYPES)
+            self._metrics_cache = None
             print(f"Dataset loaded successfully: {self.data.shape[0]} rows, {self.data.shape[1]} columns")
             
             # Basic data preprocessing
@@ -45,19 +115,30 @@ class CompasBiasAuditor:
     
     def _preprocess_data(self):
         """Clean and preprocess the COMPAS data."""
-        # Filter relevant columns and remove missing values
-        relevant_cols = ['race', 'age', 'sex', 'priors_count', 'c_charge_degree', 
-                        'two_year_recid', 'decile_score', 'score_text']
-        
-        self.data = self.data[relevant_cols].copy()
-        self.data = self.data.dropna()
+        # Remove missing values (columns are already projected at read time)
+        self.data = self.data.dropna().astype(INT_DTYPES)
         
         # Create binary race categories (African-American vs Others)
-        self.data['race_binary'] = (self.data['race'] == 'African-American').astype(int)
+        # Compare integer category codes rather than the race labels
+        race = self.data['race'].cat
+        aa_code = race.categories.get_loc('African-American') if 'African-American' in race.categories else -1
+        self._aa_mask = race.codes.values == aa_code
+        self.data['race_binary'] = self._aa_mask.astype(int)
+        
+        # Binary classification: high risk (score >= 5) vs low risk (score < 5)
+        self._high_risk = (self.data['decile_score'].values >= 5).astype(np.int8)
+        
+        # Per-race outcome and score statistics in a single groupby pass
+        self._group_stats = self.data.groupby('race', observed=True, sort=False).agg(
+            recid_rate=(self.outcome_column, 'mean'),
+            recid_count=(self.outcome_column, 'size'),
+            score_mean=('decile_score', 'mean'),
+            score_std=('decile_score', 'std'),
+        )
         
         print("Data preprocessing completed.")
         print(f"Final dataset shape: {self.data.shape}")
-        print(f"Race distribution: {self.data['race'].value_counts()}")
+        print(f"Race distribution: {self.data['race'].value_counts(sort=False)}")
         
     def calculate_basic_statistics(self):
         """Calculate basic statistics for the dataset."""
@@ -70,36 +151,32 @@ class CompasBiasAuditor:
         print(f"Overall recidivism rate: {overall_recidivism:.3f}")
         
         # Recidivism rates by race
-        recidivism_by_race = self.data.groupby('race')[self.outcome_column].agg(['mean', 'count'])
+        recidivism_by_race = self._group_stats[['recid_rate', 'recid_count']].set_axis(['mean', 'count'], axis=1)
         print("\nRecidivism rates by race:")
         print(recidivism_by_race)
         
         # COMPAS score distribution by race
-        score_by_race = self.data.groupby('race')['decile_score'].agg(['mean', 'std'])
+        score_by_race = self._group_stats[['score_mean', 'score_std']].set_axis(['mean', 'std'], axis=1)
         print("\nCOMPAS decile scores by race:")
         print(score_by_race)
         
         return recidivism_by_race, score_by_race
     
     def calculate_fairness_metrics(self):
-        """Calculate comprehensive fairness metrics."""
+        """Calculate comprehensive fairness metrics (cached per loaded dataset)."""
+        if self._metrics_cache is not None:
+            return self._metrics_cache
+        
         print("\n" + "="*50)
         print("FAIRNESS METRICS ANALYSIS")
         print("="*50)
         
-        # Convert to AI Fairness 360 format
-        dataset = self._convert_to_aif360_format()
-        
-        # Define privileged and unprivileged groups
-        privileged_race = np.array([[1]])  # African-American = 1
-        unprivileged_race = np.array([[0]])  # Others = 0
-        
-        # Binary classification: high risk (score >= 5) vs low risk (score < 5)
-        y_pred = (self.data['decile_score'] >= 5).astype(int)
+        # High-risk predictions precomputed during preprocessing
+        y_pred = self._high_risk
         y_true = self.data[self.outcome_column].values
         
         # Race labels
-        race_labels = self.data['race_binary'].values
+        race_labels = self._aa_mask
         
         # Calculate metrics
         metrics = {}
@@ -110,17 +187,18 @@ class CompasBiasAuditor:
         metrics['recall'] = recall_score(y_true, y_pred)
         metrics['f1'] = f1_score(y_true, y_pred)
         
-        # Group-specific metrics
-        african_american_mask = race_labels == 1
-        others_mask = race_labels == 0
+        # Group-specific metrics from a single contingency-table pass
+        counts = _contingency_counts(race_labels, y_true, y_pred, use_numba=self.use_numba)
+        tn_others, fp_others, fn_others, tp_others = counts[0b000], counts[0b001], counts[0b010], counts[0b011]
+        tn_aa, fp_aa, fn_aa, tp_aa = counts[0b100], counts[0b101], counts[0b110], counts[0b111]
         
         # True Positive Rate (Sensitivity)
-        metrics['tpr_african_american'] = recall_score(y_true[african_american_mask], y_pred[african_american_mask])
-        metrics['tpr_others'] = recall_score(y_true[others_mask], y_pred[others_mask])
+        metrics['tpr_african_american'] = tp_aa / (tp_aa + fn_aa) if tp_aa + fn_aa > 0 else 0
+        metrics['tpr_others'] = tp_others / (tp_others + fn_others) if tp_others + fn_others > 0 else 0
         
         # False Positive Rate
-        fpr_aa = np.sum((y_true[african_american_mask] == 0) & (y_pred[african_american_mask] == 1)) / np.sum(y_true[african_american_mask] == 0)
-        fpr_others = np.sum((y_true[others_mask] == 0) & (y_pred[others_mask] == 1)) / np.sum(y_true[others_mask] == 0)
+        fpr_aa = fp_aa / (fp_aa + tn_aa)
+        fpr_others = fp_others / (fp_others + tn_others)
         metrics['fpr_african_american'] = fpr_aa
         metrics['fpr_others'] = fpr_others
         
@@ -131,8 +209,8 @@ class CompasBiasAuditor:
         metrics['tnr_others'] = tnr_others
         
         # Demographic Parity (Selection Rate)
-        selection_rate_aa = np.mean(y_pred[african_american_mask])
-        selection_rate_others = np.mean(y_pred[others_mask])
+        selection_rate_aa = (tp_aa + fp_aa) / counts[0b100:].sum()
+        selection_rate_others = (tp_others + fp_others) / counts[:0b100].sum()
         metrics['selection_rate_african_american'] = selection_rate_aa
         metrics['selection_rate_others'] = selection_rate_others
         
@@ -145,11 +223,18 @@ class CompasBiasAuditor:
         # Disparate Impact
         metrics['disparate_impact'] = selection_rate_aa / selection_rate_others if selection_rate_others > 0 else float('inf')
         
+        # Plain Python floats for the report's comparisons and formatting
+        metrics = {k: float(v) for k, v in metrics.items()}
+        
+        self._metrics_cache = metrics
         return metrics
     
     def _convert_to_aif360_format(self):
         """Convert data to AI Fairness 360 format."""
         try:
+            # Imported lazily: AIF360 pulls in a heavy dependency chain
+            from aif360.algorithms.preprocessing.optim_preproc_helpers.data_preprocessing_functions import load_preproc_data_compas
+            
             # Use AI Fairness 360's built-in COMPAS preprocessing
             dataset = load_preproc_data_compas()
             return dataset
@@ -157,13 +242,13 @@ class CompasBiasAuditor:
             # Fallback to manual preprocessing
             return None
     
-    def generate_visualizations(self):
+    def generate_visualizations(self, metrics=None, dpi=150):
         """Generate comprehensive bias visualization."""
         fig, axes = plt.subplots(2, 3, figsize=(18, 12))
         fig.suptitle('COMPAS Recidivism Risk Score Bias Analysis', fontsize=16, fontweight='bold')
         
         # 1. Recidivism rates by race
-        recidivism_rates = self.data.groupby('race')[self.outcome_column].mean().sort_values(ascending=False)
+        recidivism_rates = self._group_stats['recid_rate'].sort_values(ascending=False)
         axes[0, 0].bar(range(len(recidivism_rates)), recidivism_rates.values, color=['red', 'orange', 'blue', 'green'])
         axes[0, 0].set_title('Recidivism Rates by Race')
         axes[0, 0].set_xticks(range(len(recidivism_rates)))
@@ -173,17 +258,17 @@ class CompasBiasAuditor:
             axes[0, 0].text(i, v + 0.01, f'{v:.3f}', ha='center', va='bottom')
         
         # 2. COMPAS score distribution by race
-        race_categories = self.data['race'].unique()
-        for race in race_categories:
-            race_data = self.data[self.data['race'] == race]['decile_score']
-            axes[0, 1].hist(race_data, alpha=0.7, label=race, bins=10)
+        score_groups = {race: group['decile_score'].values
+                        for race, group in self.data.groupby('race', observed=True, sort=False)}
+        axes[0, 1].hist(list(score_groups.values()), alpha=0.7, label=list(score_groups), bins=np.arange(1, 12))
         axes[0, 1].set_title('COMPAS Decile Score Distribution by Race')
         axes[0, 1].set_xlabel('Decile Score')
         axes[0, 1].set_ylabel('Frequency')
         axes[0, 1].legend()
         
         # 3. False Positive Rates by race
-        metrics = self.calculate_fairness_metrics()
+        if metrics is None:
+            metrics = self.calculate_fairness_metrics()
         races = ['African American', 'Others']
         fprs = [metrics['fpr_african_american'], metrics['fpr_others']]
         colors = ['red', 'blue']
@@ -215,20 +300,22 @@ class CompasBiasAuditor:
         axes[1, 1].text(0, disparate_impact + 0.05, f'{disparate_impact:.3f}', ha='center', va='bottom')
         
         # 6. Bias Summary Heatmap
-        bias_metrics = pd.DataFrame({
-            'African American': [metrics['tpr_african_american'], metrics['fpr_african_american'], 
-                                metrics['selection_rate_african_american'], metrics['tnr_african_american']],
-            'Others': [metrics['tpr_others'], metrics['fpr_others'], 
-                      metrics['selection_rate_others'], metrics['tnr_others']]
-        }, index=['True Positive Rate', 'False Positive Rate', 'Selection Rate', 'True Negative Rate'])
+        bias_metrics = np.array([
+            [metrics['tpr_african_american'], metrics['tpr_others']],
+            [metrics['fpr_african_american'], metrics['fpr_others']],
+            [metrics['selection_rate_african_american'], metrics['selection_rate_others']],
+            [metrics['tnr_african_american'], metrics['tnr_others']],
+        ])
         
         sns.heatmap(bias_metrics, annot=True, cmap='RdYlBu_r', ax=axes[1, 2], 
-                   cbar_kws={'label': 'Rate'}, fmt='.3f')
+                   cbar_kws={'label': 'Rate'}, fmt='.3f',
+                   xticklabels=['African American', 'Others'],
+                   yticklabels=['True Positive Rate', 'False Positive Rate', 'Selection Rate', 'True Negative Rate'])
         axes[1, 2].set_title('Fairness Metrics Heatmap')
         
         plt.tight_layout()
-        plt.savefig('compas_bias_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        plt.savefig('compas_bias_analysis.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
         
         return bias_metrics
     
@@ -247,7 +334,13 @@ class CompasBiasAuditor:
         metrics = self.calculate_fairness_metrics()
         
         # Generate visualizations
-        bias_heatmap = self.generate_visualizations()
+        bias_heatmap = self.generate_visualizations(metrics)
+        
+        # Derived values used in the report body
+        n_african_american = int(np.count_nonzero(self._aa_mask))
+        n_others = self._aa_mask.size - n_african_american
+        fairness_score = 1 - abs(metrics['fpr_difference']) - abs(metrics['disparate_impact'] - 1)
+        generated_at = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
         
         # Compile findings
         report = f"""
@@ -256,8 +349,8 @@ class CompasBiasAuditor:
         
         Dataset Overview:
         - Total records analyzed: {len(self.data):,}
-        - African American defendants: {sum(self.data['race'] == 'African-American'):,}
-        - Other race defendants: {sum(self.data['race'] != 'African-American'):,}
+        - African American defendants: {n_african_american:,}
+        - Other race defendants: {n_others:,}
         - Overall recidivism rate: {self.data[self.outcome_column].mean():.3f}
         
         KEY FINDINGS - EVIDENCE OF BIAS:
@@ -274,7 +367,7 @@ class CompasBiasAuditor:
            - FPR Difference: {metrics['fpr_difference']:.3f}
            - ASSESSMENT: {'VIOLATED' if metrics['fpr_difference'] > 0.05 else 'ACCEPTABLE'}
         
-        3. ALGORITHMIC FAIRNESS SCORE: {1 - abs(metrics['fpr_difference']) - abs(metrics['disparate_impact'] - 1):.3f}/1.0
+        3. ALGORITHMIC FAIRNESS SCORE: {fairness_score:.3f}/1.0
         
         CRITICAL BIAS INDICATORS:
         - African Americans are {metrics['disparate_impact']:.2f}x more likely to be classified as high-risk
@@ -319,7 +412,7 @@ class CompasBiasAuditor:
         to be classified as high-risk. Immediate remediation is required to ensure fair treatment
         and prevent discriminatory outcomes in criminal justice decisions.
         
-        Report Generated: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}
+        Report Generated: {generated_at}
         Analyst: AI Ethics Audit Framework v1.0
         """
         
@@ -8,11 +8,39 @@ This script performs bias analysis of the COMPAS dataset using standard Python l
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: figures are only saved to disk
 import matplotlib.pyplot as plt
 import seaborn as sns
 import warnings
 warnings.filterwarnings('ignore')
 
+# Columns used by the audit and the narrowest dtypes that hold them. Integer
+# columns are read as nullable types so rows with missing values survive
+# parsing and are removed by dropna(); INT_DTYPES is applied afterwards.
+RELEVANT_COLUMNS = ['race', 'age', 'sex', 'priors_count', 'c_charge_degree',
+                    'two_year_recid', 'decile_score', 'score_text']
+COLUMN_DTYPES = {
+    'race': 'category',
+    'sex': 'category',
+    'c_charge_degree': 'category',
+    'score_text': 'category',
+    'two_year_recid': 'Int8',
+    'decile_score': 'Int8',
+    'priors_count': 'Int16',
+    'age': 'Int16',
+}
+INT_DTYPES = {
+    'two_year_recid': np.int8,
+    'decile_score': np.int8,
+    'priors_count': np.int16,
+    'age': np.int16,
+}
+
+# Scalar metrics reported by analyze_bias
+METRIC_KEYS = ['selection_rate_aa', 'selection_rate_other', 'disparate_impact',
+               'fpr_aa', 'fpr_other', 'tpr_aa', 'tpr_other']
+
 def load_and_analyze_compas():
     """Load COMPAS data and perform bias analysis."""
     
@@ -21,14 +49,12 @@ def load_and_analyze_compas():
     
     # Load data
     try:
-        data = pd.read_csv('compas-scores-two-years.csv')
+        data = pd.read_csv('compas-scores-two-years.csv', usecols=RELEVANT_COLUMNS, dtype=COLUMN_DTYPES)
         print(f"Dataset loaded: {data.shape[0]} rows, {data.shape[1]} columns")
         
         # Clean data
-        relevant_cols = ['race', 'age', 'sex', 'priors_count', 'c_charge_degree', 
-                        'two_year_recid', 'decile_score', 'score_text']
-        data = data[relevant_cols].dropna()
-        data['race_binary'] = (data['race'] == 'African-American').astype(int)
+        data = data.dropna().astype(INT_DTYPES)
+        data['race_binary'] = african_american_mask(data).astype(int)
         
         print(f"After cleaning: {data.shape[0]} rows")
         
@@ -40,74 +66,129 @@ def load_and_analyze_compas():
     print("\nBasic Statistics:")
     print(f"Overall recidivism rate: {data['two_year_recid'].mean():.3f}")
     
+    # Per-race statistics in a single groupby pass
+    group_stats = calculate_group_statistics(data)
+    
     # Recidivism by race
-    recid_by_race = data.groupby('race')['two_year_recid'].agg(['mean', 'count'])
+    recid_by_race = group_stats[['recid_rate', 'recid_count']].set_axis(['mean', 'count'], axis=1)
     print("\nRecidivism by race:")
     print(recid_by_race)
     
     # COMPAS scores by race
-    score_by_race = data.groupby('race')['decile_score'].mean()
+    score_by_race = group_stats['score_mean'].rename('decile_score')
     print("\nAverage COMPAS score by race:")
     print(score_by_race)
     
+    # High-risk classification, shared by the metrics and the plots
+    high_risk = compute_high_risk(data)
+    
     # Fairness metrics calculation
-    analyze_bias(data)
+    metrics = analyze_bias(data, high_risk)
     
     # Generate visualizations
-    create_visualizations(data)
+    create_visualizations(data, group_stats, high_risk)
     
     # Generate report
-    generate_audit_report(data)
+    generate_audit_report(data, metrics)
+
+def calculate_group_statistics(data):
+    """Aggregate recidivism and COMPAS score statistics by race."""
+    return data.groupby('race', observed=True, sort=False).agg(
+        recid_rate=('two_year_recid', 'mean'),
+        recid_count=('two_year_recid', 'size'),
+        score_mean=('decile_score', 'mean'),
+    )
+
+def african_american_mask(data):
+    """Return a boolean array marking African American defendants, via the race category codes."""
+    race = data['race'].cat
+    aa_code = race.categories.get_loc('African-American') if 'African-American' in race.categories else -1
+    return race.codes.values == aa_code
+
+def compute_high_risk(data, threshold=5):
+    """Return the high-risk classification (decile score >= threshold) as an int8 array."""
+    return (data['decile_score'].values >= threshold).astype(np.int8)
 
-def analyze_bias(data):
-    """Calculate fairness metrics."""
+def _grouped_contingency_counts(aa, recid, high_risk, group_codes=None):
+    """
+    Count (race, outcome, high-risk) cells per subgroup as a (G, 8) array.
+    
+    Column index bits are African American (4) | recidivated (2) | high risk (1).
+    Rows follow the non-negative integer group_codes; without them G is 1.
+    """
+    key = (aa.astype(np.int64) << 2) | (recid.astype(np.int64) << 1) | high_risk
+    n_groups = 1
+    if group_codes is not None:
+        group_codes = np.asarray(group_codes, dtype=np.int64)
+        n_groups = int(group_codes.max()) + 1 if group_codes.size else 1
+        key = key + 8 * group_codes
+    return np.bincount(key, minlength=8 * n_groups).reshape(n_groups, 8)
+
+def _safe_rate(numerator, denominator):
+    """Elementwise ratio that is 0 where the denominator is empty."""
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+def _bias_from_counts(counts):
+    """Compute fairness metrics and verdicts for every row of a (G, 8) count array."""
+    counts = np.asarray(counts, dtype=np.float64)
+    tn_other, fp_other, fn_other, tp_other, tn_aa, fp_aa, fn_aa, tp_aa = counts.T
+    n_aa = counts[:, 4:].sum(axis=1)
+    n_other = counts[:, :4].sum(axis=1)
+    both_groups = (n_aa > 0) & (n_other > 0)
+    
+    bias = {
+        # Undefined (NaN) for a race group with no defendants in the row
+        'selection_rate_aa': np.where(n_aa > 0, _safe_rate(tp_aa + fp_aa, n_aa), np.nan),
+        'selection_rate_other': np.where(n_other > 0, _safe_rate(tp_other + fp_other, n_other), np.nan),
+        'fpr_aa': _safe_rate(fp_aa, fp_aa + tn_aa),
+        'fpr_other': _safe_rate(fp_other, fp_other + tn_other),
+        'tpr_aa': _safe_rate(tp_aa, tp_aa + fn_aa),
+        'tpr_other': _safe_rate(tp_other, tp_other + fn_other),
+    }
+    
+    # Infinite when only African Americans are classified high-risk (so the
+    # 125% rule flags it); undefined when nobody is, or when a race group is
+    # missing from the row
+    sel_aa, sel_other = bias['selection_rate_aa'], bias['selection_rate_other']
+    bias['disparate_impact'] = np.where(
+        ~both_groups,
+        np.nan,
+        np.where(
+            sel_other > 0,
+            sel_aa / np.where(sel_other > 0, sel_other, 1),
+            np.where(sel_aa > 0, np.inf, np.nan),
+        ),
+    )
+    bias['fpr_difference'] = np.abs(bias['fpr_aa'] - bias['fpr_other'])
+    
+    # Verdicts: 80%-125% rule for demographic parity, 5% FPR gap for equal
+    # opportunity; only meaningful when both race groups are present
+    di = bias['disparate_impact']
+    bias['dp_violated'] = both_groups & ((di < 0.8) | (di > 1.2))
+    bias['eo_violated'] = both_groups & (bias['fpr_difference'] > 0.05)
+    return bias
+
+def analyze_bias(data, high_risk=None, group_col=None):
+    """
+    Calculate fairness metrics.
+    
+    If group_col is given, verdicts are also printed for each of its subgroups,
+    computed together in one counting pass.
+    """
     print("\n" + "="*50)
     print("FAIRNESS METRICS ANALYSIS")
     print("="*50)
     
-    # Define high-risk threshold
-    high_risk_threshold = 5
-    data['high_risk'] = (data['decile_score'] >= high_risk_threshold).astype(int)
-    
-    # Group data
-    aa_data = data[data['race'] == 'African-American']
-    other_data = data[data['race'] != 'African-American']
-    
-    # Calculate metrics
-    metrics = {}
+    if high_risk is None:
+        high_risk = compute_high_risk(data)
     
-    # Selection rates (demographic parity)
-    metrics['selection_rate_aa'] = aa_data['high_risk'].mean()
-    metrics['selection_rate_other'] = other_data['high_risk'].mean()
-    metrics['disparate_impact'] = metrics['selection_rate_aa'] / metrics['selection_rate_other']
+    # One (race, outcome, high-risk) contingency table for the whole dataset
+    aa = african_american_mask(data)
+    recid = data['two_year_recid'].values.astype(np.int8)
+    bias = _bias_from_counts(_grouped_contingency_counts(aa, recid, high_risk))
     
-    # False Positive Rates
-    aa_actual_no_recid = aa_data[aa_data['two_year_recid'] == 0]
-    other_actual_no_recid = other_data[other_data['two_year_recid'] == 0]
-    
-    if len(aa_actual_no_recid) > 0:
-        metrics['fpr_aa'] = aa_actual_no_recid['high_risk'].mean()
-    else:
-        metrics['fpr_aa'] = 0
-        
-    if len(other_actual_no_recid) > 0:
-        metrics['fpr_other'] = other_actual_no_recid['high_risk'].mean()
-    else:
-        metrics['fpr_other'] = 0
-    
-    # True Positive Rates
-    aa_actual_recid = aa_data[aa_data['two_year_recid'] == 1]
-    other_actual_recid = other_data[other_data['two_year_recid'] == 1]
-    
-    if len(aa_actual_recid) > 0:
-        metrics['tpr_aa'] = aa_actual_recid['high_risk'].mean()
-    else:
-        metrics['tpr_aa'] = 0
-        
-    if len(other_actual_recid) > 0:
-        metrics['tpr_other'] = other_actual_recid['high_risk'].mean()
-    else:
-        metrics['tpr_other'] = 0
+    # Plain Python floats for the comparisons and formatting below
+    metrics = {key: float(bias[key][0]) for key in METRIC_KEYS}
     
     # Print results
     print(f"Demographic Parity (High-Risk Classification):")
@@ -118,7 +199,7 @@ def analyze_bias(data):
     print(f"\nFalse Positive Rates:")
     print(f"  African American: {metrics['fpr_aa']:.3f}")
     print(f"  Others: {metrics['fpr_other']:.3f}")
-    print(f"  Difference: {abs(metrics['fpr_aa'] - metrics['fpr_other']):.3f}")
+    print(f"  Difference: {bias['fpr_difference'][0]:.3f}")
     
     print(f"\nTrue Positive Rates:")
     print(f"  African American: {metrics['tpr_aa']:.3f}")
@@ -126,19 +207,40 @@ def analyze_bias(data):
     
     # Assessment
     print(f"\nBias Assessment:")
-    if metrics['disparate_impact'] < 0.8 or metrics['disparate_impact'] > 1.2:
+    if bias['dp_violated'][0]:
         print("  WARNING: DEMOGRAPHIC PARITY VIOLATED (80%-125% rule)")
     else:
         print("  OK: Demographic parity acceptable")
     
-    if abs(metrics['fpr_aa'] - metrics['fpr_other']) > 0.05:
+    if bias['eo_violated'][0]:
         print("  WARNING: EQUAL OPPORTUNITY VIOLATED (>5% difference)")
     else:
         print("  OK: Equal opportunity acceptable")
     
+    if group_col is not None:
+        print_subgroup_bias(data, group_col, aa, recid, high_risk)
+    
     return metrics
 
-def create_visualizations(data):
+def print_subgroup_bias(data, group_col, aa, recid, high_risk):
+    """Print disparate impact, FPR difference and verdicts for each subgroup of group_col."""
+    group_codes, group_labels = pd.factorize(data[group_col], sort=True)
+    bias = _bias_from_counts(_grouped_contingency_counts(aa, recid, high_risk, group_codes))
+    
+    print(f"\nSubgroup Assessment by {group_col}:")
+    for i, label in enumerate(group_labels):
+        if np.isnan(bias['disparate_impact'][i]):
+            print(f"  {label}: not assessed (a race group is missing or no one is high-risk)")
+            continue
+        flags = []
+        if bias['dp_violated'][i]:
+            flags.append("DEMOGRAPHIC PARITY VIOLATED")
+        if bias['eo_violated'][i]:
+            flags.append("EQUAL OPPORTUNITY VIOLATED")
+        print(f"  {label}: Disparate Impact {bias['disparate_impact'][i]:.3f}, "
+              f"FPR Difference {bias['fpr_difference'][i]:.3f} - {', '.join(flags) or 'OK'}")
+
+def create_visualizations(data, group_stats=None, high_risk=None, dpi=150):
     """Create bias visualization plots."""
     print("\nGenerating visualizations...")
     
@@ -147,7 +249,9 @@ def create_visualizations(data):
     fig.suptitle('COMPAS Recidivism Bias Analysis', fontsize=16, fontweight='bold')
     
     # 1. Recidivism rates by race
-    recid_rates = data.groupby('race')['two_year_recid'].mean().sort_values(ascending=False)
+    if group_stats is None:
+        group_stats = calculate_group_statistics(data)
+    recid_rates = group_stats['recid_rate'].sort_values(ascending=False)
     axes[0, 0].bar(range(len(recid_rates)), recid_rates.values, color=['red', 'orange', 'blue'])
     axes[0, 0].set_title('Recidivism Rates by Race')
     axes[0, 0].set_xticks(range(len(recid_rates)))
@@ -155,19 +259,21 @@ def create_visualizations(data):
     axes[0, 0].set_ylabel('Recidivism Rate')
     
     # 2. COMPAS score distribution
-    aa_scores = data[data['race'] == 'African-American']['decile_score']
-    other_scores = data[data['race'] != 'African-American']['decile_score']
+    aa = african_american_mask(data)
+    scores = data['decile_score'].values
     
-    axes[0, 1].hist(aa_scores, alpha=0.7, label='African American', bins=10, color='red')
-    axes[0, 1].hist(other_scores, alpha=0.7, label='Others', bins=10, color='blue')
+    axes[0, 1].hist([scores[aa], scores[~aa]], alpha=0.7, label=['African American', 'Others'],
+                    bins=np.arange(1, 12), color=['red', 'blue'])
     axes[0, 1].set_title('COMPAS Score Distribution')
     axes[0, 1].set_xlabel('Decile Score')
     axes[0, 1].set_ylabel('Frequency')
     axes[0, 1].legend()
     
     # 3. High-risk classification rates
-    high_risk_aa = (data[data['race'] == 'African-American']['decile_score'] >= 5).mean()
-    high_risk_other = (data[data['race'] != 'African-American']['decile_score'] >= 5).mean()
+    if high_risk is None:
+        high_risk = compute_high_risk(data)
+    high_risk_aa = high_risk[aa].mean()
+    high_risk_other = high_risk[~aa].mean()
     
     axes[1, 0].bar(['African American', 'Others'], [high_risk_aa, high_risk_other], 
                    color=['red', 'blue'], alpha=0.7)
@@ -175,11 +281,12 @@ def create_visualizations(data):
     axes[1, 0].set_ylabel('Classification Rate')
     
     # 4. False Positive Rates
-    aa_no_recid = data[(data['race'] == 'African-American') & (data['two_year_recid'] == 0)]
-    other_no_recid = data[(data['race'] != 'African-American') & (data['two_year_recid'] == 0)]
+    no_recid = data['two_year_recid'].values == 0
+    aa_no_recid = aa & no_recid
+    other_no_recid = ~aa & no_recid
     
-    fpr_aa = (aa_no_recid['decile_score'] >= 5).mean() if len(aa_no_recid) > 0 else 0
-    fpr_other = (other_no_recid['decile_score'] >= 5).mean() if len(other_no_recid) > 0 else 0
+    fpr_aa = high_risk[aa_no_recid].mean() if aa_no_recid.any() else 0
+    fpr_other = high_risk[other_no_recid].mean() if other_no_recid.any() else 0
     
     axes[1, 1].bar(['African American', 'Others'], [fpr_aa, fpr_other], 
                    color=['red', 'blue'], alpha=0.7)
@@ -187,15 +294,12 @@ def create_visualizations(data):
     axes[1, 1].set_ylabel('False Positive Rate')
     
     plt.tight_layout()
-    plt.savefig('compas_bias_analysis.png', dpi=300, bbox_inches='tight')
+    plt.savefig('compas_bias_analysis.png', dpi=dpi, bbox_inches='tight')
     print("Visualization saved as 'compas_bias_analysis.png'")
     plt.close()
 
-def generate_audit_report(data):
-    """Generate the 300-word audit report."""
-    
-    # Calculate final metrics
-    metrics = analyze_bias(data)
+def generate_audit_report(data, metrics):
+    """Generate the 300-word audit report from precomputed bias metrics."""
     
     report = f"""
 COMPAS RECIDIVISM ALGORITHM BIAS AUDIT REPORT